@@ -1,14 +1,18 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_bootstrap import Bootstrap
 from flask_ckeditor import CKEditor
 from datetime import date
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin, login_user, LoginManager, current_user, logout_user
 from forms import RegisterForm, LoginForm, CommentForm
 from flask_gravatar import Gravatar
 from functools import wraps
+import os
+import time
+import click
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = '8BYkEfBA6O6donzWlSihBXox7C0sKR6b'
@@ -16,7 +20,7 @@ ckeditor = CKEditor(app)
 Bootstrap(app)
 
 ##CONNECT TO DB
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///todo.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///todo.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
@@ -73,6 +77,8 @@ class ToDoBasic(UserMixin, db.Model):
 ##CREATE TASK ADVANCED TABLE IN DB
 class Checklist(UserMixin, db.Model):
     __tablename__ = "checklist"
+    # ids are never reused, the activity log refers to deleted rows by id
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
 
     text = db.Column(db.String(250), nullable=False)
@@ -85,6 +91,7 @@ class Checklist(UserMixin, db.Model):
 ##CREATE TASK ADVANCED TABLE IN DB
 class ToDo(UserMixin, db.Model):
     __tablename__ = "todo"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(300))
     checkbox = db.Column(db.String(100))
@@ -97,6 +104,7 @@ class ToDo(UserMixin, db.Model):
 ##CREATE TASK ADVANCED TABLE IN DB
 class Task(UserMixin, db.Model):
     __tablename__ = "tasks"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
 
 
@@ -114,6 +122,7 @@ class Task(UserMixin, db.Model):
 ##CREATE SUBTASK ADVANCED TABLE IN DB
 class Subtask(UserMixin, db.Model):
     __tablename__ = "subtasks"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
 
     text = db.Column(db.String(300), nullable=False)
@@ -132,6 +141,7 @@ class Subtask(UserMixin, db.Model):
 ##CREATE TASK COMMENT TABLE IN DB
 class Comment(db.Model):
     __tablename__ = "comments"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
 
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"))
@@ -146,6 +156,7 @@ class Comment(db.Model):
 ##CREATE SUBTASK COMMENT TABLE IN DB
 class Subtask_Comment(db.Model):
     __tablename__ = "subtasks_comments"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True)
 
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"))
@@ -157,6 +168,127 @@ class Subtask_Comment(db.Model):
     text = db.Column(db.Text, nullable=False)
 
 
+##CREATE ACTIVITY LOG TABLES IN DB
+# Rows are only ever inserted (and later rolled into a snapshot by compact-activity),
+# so they are kept small: integer codes instead of strings and a unix timestamp.
+TARGET_TASK = 1
+TARGET_CHECKLIST = 2
+
+ACTION_CREATED = 1
+ACTION_TITLE = 2
+ACTION_DELETED = 3
+ACTION_COLLABORATOR_ADDED = 4
+ACTION_COLLABORATOR_LEFT = 5
+ACTION_TODO_ADDED = 6
+ACTION_TODO_CHECKED = 7
+ACTION_TODO_UNCHECKED = 8
+ACTION_TODO_DELETED = 9
+ACTION_SUBTASK_ADDED = 10
+ACTION_SUBTASK_DELETED = 11
+ACTION_SUBTASK_STATUS = 12
+ACTION_SUBTASK_PRIORITY = 13
+ACTION_SUBTASK_DEADLINE = 14
+ACTION_COMMENT_ADDED = 15
+ACTION_COMMENT_DELETED = 16
+ACTION_SUBTASK_COMMENT_ADDED = 17
+ACTION_SUBTASK_COMMENT_DELETED = 18
+
+ACTION_NAMES = {
+    ACTION_CREATED: "created",
+    ACTION_TITLE: "title",
+    ACTION_DELETED: "deleted",
+    ACTION_COLLABORATOR_ADDED: "collaborator_added",
+    ACTION_COLLABORATOR_LEFT: "collaborator_left",
+    ACTION_TODO_ADDED: "todo_added",
+    ACTION_TODO_CHECKED: "todo_checked",
+    ACTION_TODO_UNCHECKED: "todo_unchecked",
+    ACTION_TODO_DELETED: "todo_deleted",
+    ACTION_SUBTASK_ADDED: "subtask_added",
+    ACTION_SUBTASK_DELETED: "subtask_deleted",
+    ACTION_SUBTASK_STATUS: "subtask_status",
+    ACTION_SUBTASK_PRIORITY: "subtask_priority",
+    ACTION_SUBTASK_DEADLINE: "subtask_deadline",
+    ACTION_COMMENT_ADDED: "comment_added",
+    ACTION_COMMENT_DELETED: "comment_deleted",
+    ACTION_SUBTASK_COMMENT_ADDED: "subtask_comment_added",
+    ACTION_SUBTASK_COMMENT_DELETED: "subtask_comment_deleted",
+}
+
+# Everything that was logged for an item, by the action that deletes it. Compaction drops
+# these for deleted items, an added and deleted todo leaves nothing behind in the snapshot.
+ITEM_ACTIONS = {
+    ACTION_TODO_DELETED: (ACTION_TODO_ADDED, ACTION_TODO_CHECKED, ACTION_TODO_UNCHECKED, ACTION_TODO_DELETED),
+    ACTION_SUBTASK_DELETED: (ACTION_SUBTASK_ADDED, ACTION_SUBTASK_STATUS, ACTION_SUBTASK_PRIORITY,
+                             ACTION_SUBTASK_DEADLINE, ACTION_SUBTASK_DELETED),
+    ACTION_COMMENT_DELETED: (ACTION_COMMENT_ADDED, ACTION_COMMENT_DELETED),
+    ACTION_SUBTASK_COMMENT_DELETED: (ACTION_SUBTASK_COMMENT_ADDED, ACTION_SUBTASK_COMMENT_DELETED),
+}
+
+
+class Activity(db.Model):
+    __tablename__ = "activity"
+    id = db.Column(db.Integer, primary_key=True)
+
+    target_type = db.Column(db.SmallInteger, nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.SmallInteger, nullable=False)
+    user_id = db.Column(db.Integer)
+    item_id = db.Column(db.Integer)
+    value = db.Column(db.String(250))
+    created = db.Column(db.Integer, nullable=False)
+
+    recipients = relationship("ActivityRecipient")
+
+    __table_args__ = (
+        db.Index("ix_activity_target", "target_type", "target_id", "id"),
+        db.Index("ix_activity_created", "created"),
+        # compaction deletes old rows, ids must never be reused or feed cursors would break
+        {"sqlite_autoincrement": True},
+    )
+
+
+##CREATE ACTIVITY RECIPIENT TABLE IN DB
+# Collaborators of the task/checklist at the moment the event was written, so they still
+# get the event after leaving or after the task/checklist itself is deleted.
+class ActivityRecipient(db.Model):
+    __tablename__ = "activity_recipient"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"), primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_activity_recipient_activity", "activity_id"),
+    )
+
+
+##CREATE ACTIVITY SNAPSHOT TABLE IN DB
+# Compacted events: the latest change per action and item (current title, subtask status,
+# each collaborator added/left, ...) with who made it, and how many events it replaced.
+class ActivitySnapshot(db.Model):
+    __tablename__ = "activity_snapshot"
+    target_type = db.Column(db.SmallInteger, primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.SmallInteger, primary_key=True)
+    # 0 when the action has no item (title, created, deleted)
+    item_id = db.Column(db.Integer, primary_key=True)
+
+    activity_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)
+    value = db.Column(db.String(250))
+    created = db.Column(db.Integer, nullable=False)
+    events = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_activity_snapshot_feed", "target_type", "target_id", "activity_id"),
+    )
+
+
+##CREATE LAST SEEN ACTIVITY TABLE IN DB
+class ActivitySeen(db.Model):
+    __tablename__ = "activity_seen"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
+
 with app.app_context():
     db.create_all()
 
@@ -237,6 +369,8 @@ def register():
             )
 
             db.session.add(user)
+            db.session.flush()
+            db.session.add(start_activity_seen(user))
             db.session.commit()
             login_user(user)
             return redirect(url_for("get_all_todos"))
@@ -295,10 +429,10 @@ def create_new_checklist():
         text=title,
     )
     db.session.add(new_checklist)
-    db.session.commit()
+    db.session.flush()
 
     current_user.checklist.append(new_checklist)
-    db.session.commit()
+    log_activity(new_checklist, ACTION_CREATED, value=title)
 
     for todo in all_todos:
         new_todos = ToDo(
@@ -306,9 +440,10 @@ def create_new_checklist():
             checkbox=todo.checkbox,
             parent_checklist=new_checklist)
         db.session.add(new_todos)
-        db.session.commit()
+        db.session.flush()
+        log_activity(new_checklist, ACTION_TODO_ADDED, item_id=new_todos.id, value=todo.text)
         db.session.delete(todo)
-        db.session.commit()
+    db.session.commit()
     all_checklists = Checklist.query.all()
     all_todos = ToDo.query.all()
     all_tasks = Task.query.all()
@@ -327,7 +462,7 @@ def edit_checklist(checklist_id):
 @app.route("/checklist/<int:checklist_id>/add", methods=["GET", "POST"])
 @logged_only
 def add_todo_checklist(checklist_id):
-    requested_checklist = Checklist.query.get(checklist_id)
+    requested_checklist = Checklist.query.get_or_404(checklist_id)
     if request.method == 'POST':
         new_todos = ToDo(
             text=request.form.get("text"),
@@ -335,6 +470,8 @@ def add_todo_checklist(checklist_id):
             parent_checklist=requested_checklist
         )
         db.session.add(new_todos)
+        db.session.flush()
+        log_activity(requested_checklist, ACTION_TODO_ADDED, item_id=new_todos.id, value=new_todos.text)
         db.session.commit()
     return render_template("show-checklist.html", checklist=requested_checklist)
 
@@ -346,9 +483,11 @@ def set_checkbox_todo(todo_id, checklist_id):
     todo_to_update = ToDo.query.get(todo_id)
     if todo_to_update.checkbox == "fa-square-check":
         todo_to_update.checkbox = "fa-square"
+        log_activity(todo_to_update.parent_checklist, ACTION_TODO_UNCHECKED, item_id=todo_id)
         db.session.commit()
     elif todo_to_update.checkbox == "fa-square":
         todo_to_update.checkbox = "fa-square-check"
+        log_activity(todo_to_update.parent_checklist, ACTION_TODO_CHECKED, item_id=todo_id)
         db.session.commit()
     return render_template("show-checklist.html", checklist=requested_checklist)
 
@@ -360,6 +499,7 @@ def edit_checklist_title(checklist_id):
     if request.method == 'POST':
         title = request.form.get("text")
         requested_checklist.text = title
+        log_activity(requested_checklist, ACTION_TITLE, value=title)
         db.session.commit()
         return redirect(url_for('edit_checklist', checklist_id=checklist_id))
     return render_template("edit-checklist-title.html", checklist=requested_checklist)
@@ -369,6 +509,7 @@ def edit_checklist_title(checklist_id):
 @logged_only
 def checklist_todos_delete(todo_id, checklist_id):
     todo_to_delete = ToDo.query.get(todo_id)
+    log_activity(todo_to_delete.parent_checklist, ACTION_TODO_DELETED, item_id=todo_id)
     db.session.delete(todo_to_delete)
     db.session.commit()
     return redirect(url_for('edit_checklist', checklist_id=checklist_id))
@@ -378,9 +519,9 @@ def checklist_todos_delete(todo_id, checklist_id):
 @logged_only
 def delete_checklist(checklist_id):
     requested_checklist = Checklist.query.get(checklist_id)
+    log_activity(requested_checklist, ACTION_DELETED)
     for todo in requested_checklist.todo:
         db.session.delete(todo)
-        db.session.commit()
     db.session.delete(requested_checklist)
     db.session.commit()
     return redirect(url_for("all_lists"))
@@ -396,6 +537,7 @@ def checklist_add_collaborators(checklist_id):
             message = "There is no user with that email."
             return render_template("show-checklist.html", checklist=checklist, message=message)
         user.checklist.append(checklist)
+        log_activity(checklist, ACTION_COLLABORATOR_ADDED, item_id=user.id)
         db.session.commit()
         return redirect(url_for('edit_checklist', checklist_id=checklist_id))
     return render_template('add-checklist-collaborator.html', checklist=checklist)
@@ -417,8 +559,9 @@ def create_new_task():
             date=date.today().strftime("%B %d, %Y")
         )
         db.session.add(new_task)
-        db.session.commit()
+        db.session.flush()
         current_user.tasks.append(new_task)
+        log_activity(new_task, ACTION_CREATED, value=title)
         db.session.commit()
         task = Task.query.filter_by(text=title).first()
         return redirect(url_for("show_task", task_id=task.id))
@@ -441,6 +584,8 @@ def show_task(task_id):
             parent_task=requested_task
         )
         db.session.add(new_comment)
+        db.session.flush()
+        log_activity(requested_task, ACTION_COMMENT_ADDED, item_id=new_comment.id)
         db.session.commit()
 
     return render_template("task.html", task=requested_task, current_user=current_user, form=form)
@@ -455,9 +600,11 @@ def add_subtask(task_id):
             status="Set-Status",
             priority="Set-Priority",
             deadline="Set-Deadline",
-            parent_task=Task.query.get(task_id)
+            parent_task=Task.query.get_or_404(task_id)
         )
         db.session.add(new_subtask)
+        db.session.flush()
+        log_activity(new_subtask.parent_task, ACTION_SUBTASK_ADDED, item_id=new_subtask.id, value=new_subtask.text)
         db.session.commit()
     return redirect(url_for('show_task', task_id=task_id))
 
@@ -469,6 +616,7 @@ def edit_task_title(task_id):
     if request.method == 'POST':
         title = request.form.get("text")
         requested_task.text = title
+        log_activity(requested_task, ACTION_TITLE, value=title)
         db.session.commit()
         return redirect(url_for('show_task', task_id=task_id))
     return render_template("edit-task-title.html", task=requested_task)
@@ -478,12 +626,11 @@ def edit_task_title(task_id):
 @logged_only
 def delete_task(task_id):
     requested_task = Task.query.get(task_id)
+    log_activity(requested_task, ACTION_DELETED)
     for subtask in requested_task.subtasks:
         db.session.delete(subtask)
-        db.session.commit()
     for comment in requested_task.comments:
         db.session.delete(comment)
-        db.session.commit()
     db.session.delete(requested_task)
     db.session.commit()
     return redirect(url_for("all_lists"))
@@ -492,6 +639,7 @@ def delete_task(task_id):
 @logged_only
 def delete_comment(task_id, comment_id):
     requested_comment = Comment.query.get(comment_id)
+    log_activity(requested_comment.parent_task, ACTION_COMMENT_DELETED, item_id=comment_id)
     db.session.delete(requested_comment)
     db.session.commit()
     return redirect(url_for("show_task", task_id=task_id))
@@ -510,6 +658,7 @@ def add_collaborators(task_id):
             return render_template("task.html", task=task, current_user=current_user, form=form, message=message)
         task = Task.query.get(task_id)
         user.tasks.append(task)
+        log_activity(task, ACTION_COLLABORATOR_ADDED, item_id=user.id)
         db.session.commit()
         return redirect(url_for('show_task', task_id=task_id))
     return render_template('add_task_collaborator.html', task=task)
@@ -521,6 +670,7 @@ def leave_collaborators(task_id):
     user = current_user
     task = Task.query.get(task_id)
     user.tasks.remove(task)
+    log_activity(task, ACTION_COLLABORATOR_LEFT, item_id=user.id)
     db.session.commit()
     return redirect(url_for("all_lists"))
 
@@ -534,8 +684,9 @@ def leave_collaborators(task_id):
 def delete_subtask(subtask_id, task_id):
     subtask_to_delete = Subtask.query.get(subtask_id)
     for comment in subtask_to_delete.subtasks_comments:
+        log_activity(subtask_to_delete.parent_task, ACTION_SUBTASK_COMMENT_DELETED, item_id=comment.id)
         db.session.delete(comment)
-        db.session.commit()
+    log_activity(subtask_to_delete.parent_task, ACTION_SUBTASK_DELETED, item_id=subtask_id)
     db.session.delete(subtask_to_delete)
     db.session.commit()
     return redirect(url_for('show_task', task_id=task_id))
@@ -558,6 +709,8 @@ def show_subtask(subtask_id):
             parent_subtask=requested_subtask
         )
         db.session.add(new_comment)
+        db.session.flush()
+        log_activity(requested_subtask.parent_task, ACTION_SUBTASK_COMMENT_ADDED, item_id=new_comment.id)
         db.session.commit()
 
     return render_template("subtask.html", subtask=requested_subtask, current_user=current_user, form=form,
@@ -569,6 +722,7 @@ def show_subtask(subtask_id):
 def set_status_new(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.status = "New"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_STATUS, item_id=subtask_id, value=subtask.status)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -578,6 +732,7 @@ def set_status_new(subtask_id):
 def set_status_inprogress(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.status = "In Progress"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_STATUS, item_id=subtask_id, value=subtask.status)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -587,6 +742,7 @@ def set_status_inprogress(subtask_id):
 def set_status_completed(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.status = "Completed"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_STATUS, item_id=subtask_id, value=subtask.status)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -596,6 +752,7 @@ def set_status_completed(subtask_id):
 def set_status_low(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.priority = "Low"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_PRIORITY, item_id=subtask_id, value=subtask.priority)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -605,6 +762,7 @@ def set_status_low(subtask_id):
 def set_status_middle(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.priority = "Middle"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_PRIORITY, item_id=subtask_id, value=subtask.priority)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -614,6 +772,7 @@ def set_status_middle(subtask_id):
 def set_status_high(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     subtask.priority = "High"
+    log_activity(subtask.parent_task, ACTION_SUBTASK_PRIORITY, item_id=subtask_id, value=subtask.priority)
     db.session.commit()
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
 
@@ -624,6 +783,7 @@ def save_deadline(subtask_id):
     subtask = Subtask.query.get(subtask_id)
     if request.method == 'POST':
         subtask.deadline = request.form["deadline"]
+        log_activity(subtask.parent_task, ACTION_SUBTASK_DEADLINE, item_id=subtask_id, value=subtask.deadline)
         db.session.commit()
         print(request.form["deadline"])
     return redirect(url_for('show_subtask', subtask_id=subtask_id))
@@ -633,11 +793,224 @@ def save_deadline(subtask_id):
 @logged_only
 def delete_subtask_comment(subtask_id, comment_id):
     requested_comment = Subtask_Comment.query.get(comment_id)
+    log_activity(requested_comment.parent_subtask.parent_task, ACTION_SUBTASK_COMMENT_DELETED, item_id=comment_id)
     db.session.delete(requested_comment)
     db.session.commit()
     return redirect(url_for("show_subtask", subtask_id=subtask_id))
 
 
+###### -------------- ACTIVITY LOG ------------- #####
+
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_MAX_PAGE_SIZE = 200
+
+
+def log_activity(target, action, item_id=None, value=None):
+    # target is the Task/Checklist the change belongs to, taken from the loaded rows and not from the url.
+    # Only adds the row to the session, the calling route commits it together with its own change.
+    # Call it before deleting the target, its collaborators are the recipients of the event.
+    if target is None:
+        # rows left without a parent (e.g. subtasks of a task deleted before the activity log)
+        return
+    db.session.add(Activity(
+        target_type=TARGET_TASK if isinstance(target, Task) else TARGET_CHECKLIST,
+        target_id=target.id,
+        action=action,
+        user_id=current_user.id,
+        item_id=item_id,
+        value=value[:250] if value else value,
+        created=int(time.time()),
+        recipients=[ActivityRecipient(user_id=user.id) for user in target.author]
+    ))
+
+
+def activity_to_dict(activity):
+    return {
+        "id": activity.id,
+        "target_type": activity.target_type,
+        "target_id": activity.target_id,
+        "action": ACTION_NAMES.get(activity.action, activity.action),
+        "user_id": activity.user_id,
+        "item_id": activity.item_id,
+        "value": activity.value,
+        "created": activity.created,
+    }
+
+
+def activity_page_size():
+    limit = request.args.get("limit", ACTIVITY_PAGE_SIZE, type=int)
+    return max(1, min(limit, ACTIVITY_MAX_PAGE_SIZE))
+
+
+def check_activity_access(target, target_type, target_id):
+    if target:
+        if current_user not in target.author:
+            abort(403)
+    else:
+        # deleted task/checklist, its feed stays readable for the users who received its events
+        received = ActivityRecipient.query.join(Activity).filter(
+            ActivityRecipient.user_id == current_user.id,
+            Activity.target_type == target_type,
+            Activity.target_id == target_id
+        ).first()
+        if not received:
+            abort(404)
+
+
+def activity_feed(target_type, target_id):
+    # Keyset pagination, newest first: pass the returned "next" back as ?before=<id> for the older page.
+    # Compacted events are older than every event still in the log, so once the events run out
+    # the pages go on through the snapshot with the same cursor.
+    limit = activity_page_size()
+    query = Activity.query.filter_by(target_type=target_type, target_id=target_id)
+    before = request.args.get("before", type=int)
+    if before:
+        query = query.filter(Activity.id < before)
+    events = query.order_by(Activity.id.desc()).limit(limit + 1).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+    feed = {"events": [activity_to_dict(activity) for activity in events]}
+    cursor = events[-1].id if events else None
+    if not has_more:
+        remaining = limit - len(events)
+        query = ActivitySnapshot.query.filter_by(target_type=target_type, target_id=target_id)
+        if cursor or before:
+            query = query.filter(ActivitySnapshot.activity_id < (cursor or before))
+        snapshot = query.order_by(ActivitySnapshot.activity_id.desc()).limit(remaining + 1).all()
+        has_more = len(snapshot) > remaining
+        snapshot = snapshot[:remaining]
+        if snapshot:
+            cursor = snapshot[-1].activity_id
+            feed["snapshot"] = [{
+                "id": summary.activity_id,
+                "action": ACTION_NAMES.get(summary.action, summary.action),
+                "user_id": summary.user_id,
+                "item_id": summary.item_id or None,
+                "value": summary.value,
+                "created": summary.created,
+                "events": summary.events,
+            } for summary in snapshot]
+    feed["next"] = cursor if has_more else None
+    return jsonify(feed)
+
+
+@app.route('/task/<int:task_id>/activity')
+@logged_only
+def task_activity(task_id):
+    check_activity_access(Task.query.get(task_id), TARGET_TASK, task_id)
+    return activity_feed(TARGET_TASK, task_id)
+
+
+@app.route('/checklist/<int:checklist_id>/activity')
+@logged_only
+def checklist_activity(checklist_id):
+    check_activity_access(Checklist.query.get(checklist_id), TARGET_CHECKLIST, checklist_id)
+    return activity_feed(TARGET_CHECKLIST, checklist_id)
+
+
+def start_activity_seen(user):
+    # New users (and users from before the activity log) start at the current end of the log,
+    # older events are not "new" for them.
+    return ActivitySeen(user_id=user.id, last_id=db.session.query(func.max(Activity.id)).scalar() or 0)
+
+
+def activity_seen():
+    seen = ActivitySeen.query.get(current_user.id)
+    if not seen:
+        seen = start_activity_seen(current_user)
+        db.session.add(seen)
+        db.session.commit()
+    return seen
+
+
+@app.route('/activity/new')
+@logged_only
+def new_activity():
+    # Changes made by others on the user's tasks and checklists after the last acknowledged event,
+    # oldest first. Only reads: page on with ?after=<next> and POST the last id to /activity/seen
+    # once the events were shown.
+    limit = activity_page_size()
+    after = request.args.get("after", type=int)
+    if after is None:
+        after = activity_seen().last_id
+    events = Activity.query.join(ActivityRecipient).filter(
+        ActivityRecipient.user_id == current_user.id,
+        ActivityRecipient.activity_id > after,
+        Activity.user_id != current_user.id
+    ).order_by(Activity.id).limit(limit + 1).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+    return jsonify({
+        "events": [activity_to_dict(activity) for activity in events],
+        "next": events[-1].id if events else after,
+        "more": has_more,
+    })
+
+
+@app.route('/activity/seen', methods=["POST"])
+@logged_only
+def seen_activity():
+    seen = activity_seen()
+    last_id = request.form.get("last_id", type=int)
+    if last_id is None:
+        abort(400)
+    # the marker only moves forward and never past the end of the log
+    last_id = min(last_id, db.session.query(func.max(Activity.id)).scalar() or 0)
+    seen.last_id = max(seen.last_id, last_id)
+    db.session.commit()
+    return jsonify({"last_id": seen.last_id})
+
+
+@app.cli.command("compact-activity")
+@click.option("--days", default=90, show_default=True, help="Keep events younger than this many days.")
+def compact_activity(days):
+    """Roll activity older than --days into per task/checklist snapshots."""
+    cutoff = int(time.time()) - days * 24 * 60 * 60
+    latest = db.session.query(
+        func.max(Activity.id).label("id"),
+        func.count(Activity.id).label("events")
+    ).filter(Activity.created < cutoff).group_by(
+        Activity.target_type, Activity.target_id, Activity.action, Activity.item_id
+    ).subquery()
+    old_events = db.session.query(Activity, latest.c.events).join(latest, Activity.id == latest.c.id).all()
+
+    # A deleted task/checklist keeps its feed for its collaborators until its delete event is
+    # compacted, then its whole history goes (there are no recipient rows left to grant access).
+    deleted = {(activity.target_type, activity.target_id) for activity, count in old_events
+               if activity.action == ACTION_DELETED}
+
+    total = 0
+    for activity, count in old_events:
+        total += count
+        if (activity.target_type, activity.target_id) in deleted:
+            continue
+        key = (activity.target_type, activity.target_id, activity.action, activity.item_id or 0)
+        summary = ActivitySnapshot.query.get(key)
+        if not summary:
+            summary = ActivitySnapshot(target_type=key[0], target_id=key[1], action=key[2], item_id=key[3],
+                                       activity_id=0, events=0)
+            db.session.add(summary)
+        summary.events += count
+        if activity.id > summary.activity_id:
+            summary.activity_id = activity.id
+            summary.user_id = activity.user_id
+            summary.value = activity.value
+            summary.created = activity.created
+    for target_type, target_id in deleted:
+        ActivitySnapshot.query.filter_by(target_type=target_type, target_id=target_id).delete()
+    for removed in ActivitySnapshot.query.filter(ActivitySnapshot.action.in_(list(ITEM_ACTIONS))).all():
+        ActivitySnapshot.query.filter(
+            ActivitySnapshot.target_type == removed.target_type,
+            ActivitySnapshot.target_id == removed.target_id,
+            ActivitySnapshot.item_id == removed.item_id,
+            ActivitySnapshot.action.in_(ITEM_ACTIONS[removed.action])
+        ).delete(synchronize_session=False)
+
+    old_ids = db.select(Activity.id).where(Activity.created < cutoff)
+    ActivityRecipient.query.filter(ActivityRecipient.activity_id.in_(old_ids)).delete(synchronize_session=False)
+    Activity.query.filter(Activity.created < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Compacted {total} events.")
 
 
 
@@ -0,0 +1,258 @@
+import os
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import pytest
+
+from main import app, db, Activity, ActivityRecipient, ActivitySnapshot, Subtask, TARGET_TASK, ACTION_TITLE
+
+
+@pytest.fixture
+def client_for():
+    app.config["TESTING"] = True
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    def register(email):
+        client = app.test_client()
+        client.post("/register", data={"email": email, "password": "secret", "name": email})
+        return client
+
+    yield register
+    with app.app_context():
+        db.session.remove()
+
+
+def create_task(client, title="Task"):
+    response = client.post("/new_tasks", data={"text": title})
+    return int(response.location.rsplit("/", 1)[1])
+
+
+def shared_task(owner, collaborator_email):
+    task_id = create_task(owner)
+    owner.post(f"/task/{task_id}/addcolab", data={"collaborator": collaborator_email})
+    return task_id
+
+
+def test_feed_keyset_pagination(client_for):
+    owner = client_for("a@example.com")
+    task_id = create_task(owner)
+    for title in ["one", "two", "three", "four"]:
+        owner.post(f"/edit-task/{task_id}/title", data={"text": title})
+
+    first = owner.get(f"/task/{task_id}/activity?limit=2").json
+    assert [event["value"] for event in first["events"]] == ["four", "three"]
+    second = owner.get(f"/task/{task_id}/activity?limit=2&before={first['next']}").json
+    assert [event["value"] for event in second["events"]] == ["two", "one"]
+    last = owner.get(f"/task/{task_id}/activity?limit=2&before={second['next']}").json
+    assert [event["action"] for event in last["events"]] == ["created"]
+    assert last["next"] is None
+
+
+def test_feed_forbidden_for_non_collaborator(client_for):
+    owner = client_for("a@example.com")
+    stranger = client_for("b@example.com")
+    task_id = create_task(owner)
+    assert stranger.get(f"/task/{task_id}/activity").status_code == 403
+
+
+def test_deleted_task_id_is_not_reused(client_for):
+    owner = client_for("a@example.com")
+    other = client_for("c@example.com")
+    task_id = create_task(owner)
+    owner.post(f"/edit-task/{task_id}/title", data={"text": "secret plan v2"})
+    owner.get(f"/task/{task_id}/delete")
+
+    new_task_id = create_task(other)
+    assert new_task_id != task_id
+    feed = other.get(f"/task/{new_task_id}/activity").json
+    assert [event["action"] for event in feed["events"]] == ["created"]
+
+
+def test_events_are_logged_against_the_real_parent(client_for):
+    owner = client_for("a@example.com")
+    other = client_for("b@example.com")
+    owner.get("/save-new-checklist")
+    other.get("/save-new-checklist")
+    other.post("/checklist/2/add", data={"text": "milk"})
+    other.get("/checklist/1/checkbox/1")
+
+    with app.app_context():
+        assert Activity.query.filter_by(target_id=1).count() == 1
+        assert Activity.query.filter_by(target_id=2).count() == 3
+
+
+def test_adding_to_a_missing_parent(client_for):
+    owner = client_for("a@example.com")
+    assert owner.post("/add-subtask/99", data={"text": "Subtask"}).status_code == 404
+    assert owner.post("/checklist/99/add", data={"text": "milk"}).status_code == 404
+    with app.app_context():
+        # subtask without a task, as the old add_subtask could create
+        db.session.add(Subtask(text="orphan", status="New", priority="Low", deadline="-"))
+        db.session.commit()
+    assert owner.get("/subtask/1/completed").status_code == 302
+    with app.app_context():
+        assert Activity.query.count() == 0
+
+
+def test_new_activity_marker(client_for):
+    owner = client_for("a@example.com")
+    task_id = create_task(owner)
+    collaborator = client_for("b@example.com")
+    owner.post(f"/task/{task_id}/addcolab", data={"collaborator": "b@example.com"})
+    for title in ["one", "two", "three"]:
+        owner.post(f"/edit-task/{task_id}/title", data={"text": title})
+    collaborator.post(f"/edit-task/{task_id}/title", data={"text": "mine"})
+
+    # events from before registering are not new, own changes are left out
+    page = collaborator.get("/activity/new?limit=2").json
+    assert [event["action"] for event in page["events"]] == ["collaborator_added", "title"]
+    assert page["more"]
+    # reading does not move the marker
+    assert collaborator.get("/activity/new?limit=2").json == page
+
+    rest = collaborator.get(f"/activity/new?after={page['next']}").json
+    assert [event["value"] for event in rest["events"]] == ["two", "three"]
+    assert not rest["more"]
+
+    collaborator.post("/activity/seen", data={"last_id": rest["next"]})
+    assert collaborator.get("/activity/new").json["events"] == []
+    # the marker never moves back
+    collaborator.post("/activity/seen", data={"last_id": 0})
+    assert collaborator.get("/activity/new").json["events"] == []
+
+
+def compact_all():
+    with app.app_context():
+        Activity.query.update({"created": 0})
+        db.session.commit()
+    return app.test_cli_runner().invoke(args=["compact-activity"]).output
+
+
+def test_task_and_subtask_comments_are_kept_apart(client_for):
+    owner = client_for("a@example.com")
+    task_id = create_task(owner)
+    owner.post(f"/add-subtask/{task_id}", data={"text": "Subtask"})
+    owner.post(f"/task/{task_id}", data={"text": "on the task"})
+    owner.post("/subtask/1", data={"text": "on the subtask"})
+
+    feed = owner.get(f"/task/{task_id}/activity").json
+    assert [(event["action"], event["item_id"]) for event in feed["events"][:2]] == [
+        ("subtask_comment_added", 1), ("comment_added", 1)]
+    compact_all()
+    feed = owner.get(f"/task/{task_id}/activity").json
+    summaries = {summary["action"]: summary["events"] for summary in feed["snapshot"]}
+    assert summaries["comment_added"] == 1
+    assert summaries["subtask_comment_added"] == 1
+
+
+def test_collaborator_sees_delete(client_for):
+    owner = client_for("a@example.com")
+    collaborator = client_for("b@example.com")
+    task_id = shared_task(owner, "b@example.com")
+    owner.get(f"/task/{task_id}/delete")
+
+    events = collaborator.get("/activity/new").json["events"]
+    assert events[-1]["action"] == "deleted"
+    assert events[-1]["target_id"] == task_id
+    feed = collaborator.get(f"/task/{task_id}/activity").json
+    assert feed["events"][0]["action"] == "deleted"
+    assert client_for("c@example.com").get(f"/task/{task_id}/activity").status_code == 404
+
+
+def test_deleted_task_history_goes_with_compaction(client_for):
+    owner = client_for("a@example.com")
+    collaborator = client_for("b@example.com")
+    task_id = shared_task(owner, "b@example.com")
+    owner.post(f"/edit-task/{task_id}/title", data={"text": "old title"})
+    compact_all()
+    owner.get(f"/task/{task_id}/delete")
+    assert collaborator.get(f"/task/{task_id}/activity").status_code == 200
+
+    compact_all()
+    assert collaborator.get(f"/task/{task_id}/activity").status_code == 404
+    with app.app_context():
+        assert ActivitySnapshot.query.count() == 0
+        assert ActivityRecipient.query.count() == 0
+
+
+def test_compact_activity(client_for):
+    owner = client_for("a@example.com")
+    task_id = create_task(owner, "first")
+    owner.post(f"/edit-task/{task_id}/title", data={"text": "second"})
+    owner.post(f"/edit-task/{task_id}/title", data={"text": "third"})
+    with app.app_context():
+        Activity.query.update({"created": 0})
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert "Compacted 3 events" in runner.invoke(args=["compact-activity"]).output
+
+    owner.post(f"/edit-task/{task_id}/title", data={"text": "fourth"})
+    with app.app_context():
+        assert Activity.query.count() == 1
+        assert ActivityRecipient.query.count() == 1
+        Activity.query.update({"created": 0})
+        db.session.commit()
+    runner.invoke(args=["compact-activity"])
+
+    with app.app_context():
+        assert Activity.query.count() == 0
+        title = ActivitySnapshot.query.get((TARGET_TASK, task_id, ACTION_TITLE, 0))
+        assert title.value == "fourth"
+        assert title.events == 3
+    feed = owner.get(f"/task/{task_id}/activity").json
+    assert feed["events"] == []
+    assert {summary["action"]: summary["value"] for summary in feed["snapshot"]} == {
+        "title": "fourth", "created": "first"}
+
+
+def test_compaction_drops_deleted_items(client_for):
+    owner = client_for("a@example.com")
+    owner.get("/save-new-checklist")
+    for text in ["milk", "bread", "eggs"]:
+        owner.post("/checklist/1/add", data={"text": text})
+    owner.get("/checklist/1/checkbox/1")
+    owner.get("/checklist/1/todo/1/delete")
+    owner.get("/checklist/1/todo/2/delete")
+    owner.get("/checklist/1/checkbox/3")
+    compact_all()
+
+    feed = owner.get("/checklist/1/activity").json
+    assert sorted((summary["action"], summary["item_id"]) for summary in feed["snapshot"]) == [
+        ("created", None), ("todo_added", 3), ("todo_checked", 3)]
+
+
+def test_snapshot_is_paged_with_the_events(client_for):
+    owner = client_for("a@example.com")
+    owner.get("/save-new-checklist")
+    for text in ["1", "2", "3", "4", "5"]:
+        owner.post("/checklist/1/add", data={"text": text})
+    compact_all()
+    owner.post("/edit-checklist/1/title", data={"text": "Shopping"})
+
+    first = owner.get("/checklist/1/activity?limit=2").json
+    assert [event["value"] for event in first["events"]] == ["Shopping"]
+    assert [summary["value"] for summary in first["snapshot"]] == ["5"]
+    seen = []
+    page = first
+    while page["next"]:
+        page = owner.get(f"/checklist/1/activity?limit=2&before={page['next']}").json
+        assert page["events"] == []
+        assert len(page["snapshot"]) <= 2
+        seen += [summary["value"] for summary in page["snapshot"]]
+    assert seen == ["4", "3", "2", "1", "New Checklist"]
+
+
+def test_compaction_drops_deleted_subtask_with_its_comments(client_for):
+    owner = client_for("a@example.com")
+    task_id = create_task(owner)
+    owner.post(f"/add-subtask/{task_id}", data={"text": "Subtask"})
+    owner.post("/subtask/1", data={"text": "on the subtask"})
+    owner.get("/subtask/1/completed")
+    owner.get(f"/task/{task_id}/1/delete")
+    compact_all()
+
+    feed = owner.get(f"/task/{task_id}/activity").json
+    assert [summary["action"] for summary in feed["snapshot"]] == ["created"]